@@ -5,8 +5,9 @@ from pathlib import Path
 from typing import Optional
 import cv2
 import numpy as np
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import json
 import asyncio
 from pydantic import BaseModel
@@ -14,14 +15,22 @@ import os
 import sys
 import subprocess
 from PIL import Image
-from queue import Queue, Empty
-import threading
 import yaml
 import shutil
 
+from audio import decode_audio, decoded_path, encode_samples
+from scheduler import BATCH, INTERACTIVE, InferenceScheduler, Preempted, validate_request
+from jobs import (
+    FAILED, QUEUED, RUNNING, SUCCEEDED,
+    JobStore, iter_file_range, parse_range_header,
+)
+from workspace import WorkspaceManager, WorkspaceQuotaError, remove_path
+
 # Get the absolute path to the app directory
 APP_DIR = Path(__file__).parent.absolute()
 MUSETALK_DIR = APP_DIR / "musetalk"
+MUSETALK_AVATARS_DIR = MUSETALK_DIR / "results/v15/avatars"
+MUSETALK_AVATAR_DIR = MUSETALK_AVATARS_DIR / "avator_1"
 
 # Define input/output directories
 INPUT_DIR = APP_DIR / "inputs"
@@ -52,8 +61,25 @@ class LipSyncInput(BaseModel):
     image_base64: str
     audio_base64: str
 
-# Global message queue for communication between sync and async code
-message_queue = Queue()
+# MuseTalk runs share a config file and result directory, so there is a
+# single inference slot, handed out by priority class, fair share and deadline
+scheduler = InferenceScheduler(slots=1)
+WAITING_MESSAGE = "Waiting for inference slot..."
+PREEMPTED_MESSAGE = "Paused for an interactive request, waiting for inference slot..."
+
+# File-backed store for jobs submitted over HTTP
+job_store = JobStore(OUTPUT_DIR / "jobs")
+job_tasks = {}
+background_tasks = set()
+
+# Finished jobs and their results are kept this long before being removed
+JOB_RETENTION_SECONDS = 24 * 3600
+
+# Scratch space for uploads and MuseTalk intermediates, staged on tmpfs when available
+workspace_manager = WorkspaceManager(APP_DIR / "temp")
+
+# How often a running script is checked for quota and preemption
+POLL_SECONDS = 1
 
 def save_base64_to_file(base64_str: str, file_path: Path) -> None:
     """Save base64 string to a file."""
@@ -92,130 +118,172 @@ def preprocess_image(image_bytes):
     _, buffer = cv2.imencode('.jpg', resized)
     return buffer.tobytes()
 
-async def run_inference(image_path, audio_path, websocket):
-    # Ensure output directory exists
-    output_dir = OUTPUT_DIR / "videos"
-    print(f"Output directory: {output_dir}")
-    output_dir.mkdir(exist_ok=True)
-    
-    # Update the config file with the new image and audio paths
-    config_path = APP_DIR / "configs/inference/test.yaml"
-    with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
-    
-    # Get relative paths from MUSETALK_DIR
-    relative_image_path = os.path.relpath(image_path, MUSETALK_DIR)
-    relative_audio_path = os.path.relpath(audio_path, MUSETALK_DIR)
-    
-    config["avator_1"]["video_path"] = relative_image_path
-    config["avator_1"]["audio_clips"]["audio_0"] = relative_audio_path
-    config["avator_1"]["output_dir"] = "results/v15/avatars/avator_1"
-    config["avator_1"]["tmp_dir"] = "results/v15/avatars/avator_1/tmp"
-    config["avator_1"]["vid_output_dir"] = "results/v15/avatars/avator_1/vid_output"
-    
-    with open(config_path, "w") as f:
-        yaml.safe_dump(config, f)
-    
-    print(f"[Debug] Updated config with image path: {relative_image_path}")
-    print(f"[Debug] Updated config with audio path: {relative_audio_path}")
-    
-    # Send initial message
-    await websocket.send_json({
-        "status": "processing",
-        "message": "Starting inference process..."
-    })
-    
-    # Run the realtime inference script
-    cmd = [
-        sys.executable,  # Use the current Python interpreter
-        str(MUSETALK_DIR / "scripts/realtime_inference.py"),
-        "--version", "v15",
-        "--inference_config", str(APP_DIR / "configs/inference/test.yaml"),
-        "--fps", "20",
-        "--batch_size", "3"
-    ]
-    
-    try:
+def link_avatars_dir(target: Path) -> None:
+    """Point MuseTalk's avatars dir at target, replacing only a previous link.
+
+    Raises RuntimeError if a real directory or file is in the way, so
+    existing avatar material is never deleted.
+    """
+    if MUSETALK_AVATARS_DIR.is_symlink():
+        MUSETALK_AVATARS_DIR.unlink()
+    elif MUSETALK_AVATARS_DIR.exists():
+        raise RuntimeError(
+            f"{MUSETALK_AVATARS_DIR} is not a symlink; move it aside so the server can stage avatars in its workspaces"
+        )
+    MUSETALK_AVATARS_DIR.parent.mkdir(parents=True, exist_ok=True)
+    MUSETALK_AVATARS_DIR.symlink_to(target, target_is_directory=True)
+
+def save_decoded_audio(workspace, audio_path: Path) -> None:
+    """Decode audio_path and store its 16 kHz samples next to it for run_musetalk.py.
+
+    Raises ValueError for corrupt or unsupported audio and
+    WorkspaceQuotaError if the samples do not fit in the workspace.
+    """
+    samples = decode_audio(audio_path)
+    workspace.write_stream(decoded_path(audio_path).name, io.BytesIO(encode_samples(samples)))
+
+async def run_inference(
+    image_path,
+    audio_path,
+    output_path,
+    progress,
+    workspace,
+    priority=INTERACTIVE,
+    client_id="anonymous",
+    deadline_seconds=None,
+):
+    """Run MuseTalk on the given inputs and copy the video to output_path.
+
+    `progress` is an async callable taking a status message. The run waits
+    for an inference slot according to its priority class, client and
+    optional deadline (seconds from now). Batch runs are killed when
+    interactive work is waiting and start over once they get the slot back.
+    The script's avatar material and frames are staged in `workspace` and
+    count towards its quota.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    print(f"Output path: {output_path}")
+
+    async def attempt(ticket):
+        # Update the config file with the new image and audio paths
+        config_path = APP_DIR / "configs/inference/test.yaml"
+        with open(config_path, "r") as f:
+            config = yaml.safe_load(f)
+
+        # Get relative paths from MUSETALK_DIR
+        relative_image_path = os.path.relpath(image_path, MUSETALK_DIR)
+        relative_audio_path = os.path.relpath(audio_path, MUSETALK_DIR)
+
+        config["avator_1"]["video_path"] = relative_image_path
+        config["avator_1"]["audio_clips"]["audio_0"] = relative_audio_path
+        config["avator_1"]["output_dir"] = "results/v15/avatars/avator_1"
+        config["avator_1"]["tmp_dir"] = "results/v15/avatars/avator_1/tmp"
+        config["avator_1"]["vid_output_dir"] = "results/v15/avatars/avator_1/vid_output"
+
+        with open(config_path, "w") as f:
+            yaml.safe_dump(config, f)
+
+        print(f"[Debug] Updated config with image path: {relative_image_path}")
+        print(f"[Debug] Updated config with audio path: {relative_audio_path}")
+
+        # Send initial message
+        await progress("Starting inference process...")
+
+        # Run the realtime inference script through run_musetalk.py, which
+        # feeds it the samples decoded on upload
+        cmd = [
+            sys.executable,  # Use the current Python interpreter
+            str(APP_DIR / "run_musetalk.py"),
+            "--version", "v15",
+            "--inference_config", str(APP_DIR / "configs/inference/test.yaml"),
+            "--fps", "20",
+            "--batch_size", "3"
+        ]
+
         # Set PYTHONPATH environment variable to include musetalk directory
         env = os.environ.copy()
         env["PYTHONPATH"] = f"{MUSETALK_DIR}{os.pathsep}{env.get('PYTHONPATH', '')}"
-        
-        # Change to the musetalk directory before running the script
-        original_dir = os.getcwd()
-        os.chdir(MUSETALK_DIR)
-        
+
+        await progress("Loading models and preparing data...")
+
+        # Point the script's avatars dir into the workspace so its material
+        # and frames are staged there (tmpfs when available)
+        avatars_dir = workspace.file("avatars")
+        remove_path(avatars_dir)  # left over from a preempted attempt
+        avatars_dir.mkdir()
+        link_avatars_dir(avatars_dir)
+
         try:
-            # Create a process that can handle stdin
+            # Run from the musetalk directory; 'y' answers the prompt about
+            # recreating the avatar
             process = subprocess.Popen(
                 cmd,
                 env=env,
+                cwd=MUSETALK_DIR,
                 stdin=subprocess.PIPE,
                 text=True
             )
-            
-            # Send 'y' to the process when it asks about recreating the avatar
-            process.communicate(input='y\n')
-            
-            # Send progress messages at key points
-            await websocket.send_json({
-                "status": "processing",
-                "message": "Loading models and preparing data..."
-            })
-            
-            if process.returncode == 0:
-                # Get the result video path from the script's output
-                script_output = MUSETALK_DIR / "results/v15/avatars/avator_1/vid_output/audio_0.mp4"
-                if script_output.exists():
-                    await websocket.send_json({
-                        "status": "processing",
-                        "message": "Processing complete, preparing final video..."
-                    })
-                    
-                    # Copy the file to our output directory
-                    our_output = output_dir / "result.mp4"
-                    shutil.copy2(script_output, our_output)
-                    
-                    # Read the video file and convert to base64
-                    with open(our_output, 'rb') as f:
-                        video_bytes = f.read()
-                    return base64.b64encode(video_bytes).decode('utf-8')
-                else:
-                    raise Exception("Could not find the output video file")
-            else:
+
+            # Wait off the event loop so other requests keep being served,
+            # checking the workspace quota while the script writes frames and
+            # giving way when the scheduler preempts this run
+            waiter = asyncio.ensure_future(asyncio.to_thread(process.communicate, 'y\n'))
+            try:
+                while not waiter.done():
+                    await asyncio.wait({waiter}, timeout=POLL_SECONDS)
+                    if not waiter.done():
+                        if ticket.preempt.is_set():
+                            await progress(PREEMPTED_MESSAGE)
+                            raise Preempted()
+                        await asyncio.to_thread(workspace.check_quota)
+            except BaseException:
+                # Cancelled, preempted or over quota; stop the script before its files go
+                process.kill()
+                await asyncio.wait({waiter})
+                raise
+
+            if process.returncode != 0:
                 raise Exception(f"Inference failed with return code: {process.returncode}")
-                
+
+            # Get the result video path from the script's output
+            script_output = MUSETALK_AVATAR_DIR / "vid_output/audio_0.mp4"
+            if not script_output.exists():
+                raise Exception("Could not find the output video file")
+
+            await progress("Processing complete, preparing final video...")
+
+            # Copy the file to the requested output location
+            shutil.copy2(script_output, output_path)
+            return output_path
         finally:
-            # Change back to the original directory
-            os.chdir(original_dir)
-            
-    except subprocess.CalledProcessError as e:
-        raise Exception(f"Inference failed: {e}")
+            # Only the link is removed here; the files go with the workspace
+            if MUSETALK_AVATARS_DIR.is_symlink():
+                MUSETALK_AVATARS_DIR.unlink()
+
+    await progress(WAITING_MESSAGE)
+    return await scheduler.run(attempt, priority, client_id, deadline_seconds, preemptible=priority == BATCH)
 
-async def send_messages(websocket):
-    """Async function to send messages from queue to WebSocket"""
+async def wait_for_disconnect(websocket, pending_messages):
+    """Return once the client disconnects, queueing any text it sends meanwhile."""
     while True:
-        try:
-            # Get message from queue with timeout
-            message = message_queue.get(timeout=0.1)
-            await websocket.send_json({
-                "status": "processing",
-                "message": message
-            })
-        except Empty:
-            # No messages in queue, continue
-            continue
-        except Exception as e:
-            print(f"Error sending message: {e}")
-            break
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if message.get("text") is not None:
+            pending_messages.append(message["text"])
 
 @app.websocket("/ws/lipsync")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+
+    # Messages that arrived while a request was running
+    pending_messages = []
     
     try:
         while True:
             # Receive the message
-            data = await websocket.receive_text()
+            data = pending_messages.pop(0) if pending_messages else await websocket.receive_text()
             message = json.loads(data)
             
             # Validate input
@@ -226,38 +294,71 @@ async def websocket_endpoint(websocket: WebSocket):
                 continue
             
             try:
+                # Scheduling parameters; interactive by default on the WebSocket.
+                # Fair share is keyed on the remote address, not a self-reported ID
+                priority = message.get("priority", INTERACTIVE)
+                deadline_seconds = message.get("deadline_seconds")
+                client_id = websocket.client.host
+                validate_request(priority, deadline_seconds)
+
                 # Send initial processing message
                 await websocket.send_json({
                     "status": "processing",
                     "message": "Starting inference..."
                 })
                 
-                # Decode and preprocess the image
-                image_bytes = base64.b64decode(message["image_base64"])
-                processed_image_bytes = preprocess_image(image_bytes)
-                
-                # Save the processed image
-                image_path = INPUT_DIR / "images" / "current_image.jpg"
-                with open(image_path, 'wb') as f:
-                    f.write(processed_image_bytes)
-                
-                # Save the audio
-                audio_bytes = base64.b64decode(message["audio_base64"])
-                audio_path = INPUT_DIR / "audio" / "current_audio.wav"
-                with open(audio_path, 'wb') as f:
-                    f.write(audio_bytes)
-                
-                print(f"[Debug] Saved processed image to: {image_path}")
-                print(f"[Debug] Saved audio to: {audio_path}")
-                
-                # Start message sender in background
-                message_sender = asyncio.create_task(send_messages(websocket))
-                
-                # Run inference
-                video_base64 = await run_inference(image_path, audio_path, websocket)
-                
-                # Cancel message sender
-                message_sender.cancel()
+                # Inputs get their own workspace since requests may now wait
+                # for a slot concurrently
+                with workspace_manager.workspace(prefix="ws") as workspace:
+                    # Decoding, resizing and file writes run in threads so they
+                    # don't stall other connections
+                    image_bytes = base64.b64decode(message["image_base64"])
+                    processed_image_bytes = await asyncio.to_thread(preprocess_image, image_bytes)
+
+                    # Save the processed image
+                    image_path = workspace.file("image.jpg")
+                    await asyncio.to_thread(image_path.write_bytes, processed_image_bytes)
+
+                    # Decode the audio (WAV, Opus, MP3, AAC) in-process; MuseTalk
+                    # reads the samples, the upload itself is only muxed
+                    audio_bytes = base64.b64decode(message["audio_base64"])
+                    audio_path = await asyncio.to_thread(
+                        workspace.write_stream, "audio.upload", io.BytesIO(audio_bytes)
+                    )
+                    await asyncio.to_thread(save_decoded_audio, workspace, audio_path)
+
+                    print(f"[Debug] Saved processed image to: {image_path}")
+                    print(f"[Debug] Saved audio to: {audio_path}")
+
+                    async def send_progress(message):
+                        await websocket.send_json({
+                            "status": "processing",
+                            "message": message
+                        })
+
+                    # Run inference, cancelling it if the client goes away so an
+                    # abandoned request doesn't hold or wait for the slot
+                    inference = asyncio.create_task(run_inference(
+                        image_path,
+                        audio_path,
+                        workspace.file("result.mp4"),
+                        send_progress,
+                        workspace,
+                        priority=priority,
+                        client_id=client_id,
+                        deadline_seconds=deadline_seconds,
+                    ))
+                    disconnect = asyncio.create_task(wait_for_disconnect(websocket, pending_messages))
+                    await asyncio.wait({inference, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+                    if disconnect.done():
+                        inference.cancel()
+                        await asyncio.wait({inference})
+                        raise WebSocketDisconnect()
+                    disconnect.cancel()
+                    await asyncio.wait({disconnect})
+
+                    result_path = inference.result()
+                    video_base64 = get_base64_from_file(result_path)
                 
                 # Send the result
                 await websocket.send_json({
@@ -265,6 +366,8 @@ async def websocket_endpoint(websocket: WebSocket):
                     "video_base64": video_base64
                 })
                 
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 await websocket.send_json({
                     "status": "error",
@@ -283,6 +386,205 @@ async def websocket_endpoint(websocket: WebSocket):
         except:
             pass
 
+# ---------- HTTP job API ----------
+
+# Progress reported for each status message emitted by run_inference
+PROGRESS_STEPS = {
+    WAITING_MESSAGE: 0.0,
+    PREEMPTED_MESSAGE: 0.0,
+    "Starting inference process...": 0.1,
+    "Loading models and preparing data...": 0.2,
+    "Processing complete, preparing final video...": 0.9,
+}
+
+async def process_job(job_id: str, workspace, image_path: Path, audio_path: Path, priority: str,
+                      client_id: str, deadline_seconds: Optional[float]):
+    """Background task that runs inference for a submitted job."""
+    async def update_progress(message):
+        job = job_store.get(job_id)
+        progress = PROGRESS_STEPS.get(message, job["progress"] if job else 0.0)
+        status = QUEUED if message in (WAITING_MESSAGE, PREEMPTED_MESSAGE) else RUNNING
+        job_store.update(job_id, status=status, message=message, progress=progress)
+
+    try:
+        await run_inference(
+            image_path,
+            audio_path,
+            job_store.result_path(job_id),
+            update_progress,
+            workspace,
+            priority=priority,
+            client_id=client_id,
+            deadline_seconds=deadline_seconds,
+        )
+        job_store.update(job_id, status=SUCCEEDED, progress=1.0, message="Done")
+    except asyncio.CancelledError:
+        print(f"Job {job_id} cancelled")
+        raise
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        job_store.update(job_id, status=FAILED, message="Failed", error=str(e))
+
+def finish_job(job_id: str, workspace) -> None:
+    """Release a job's workspace and task entry.
+
+    Runs as a done callback, so it also covers a task cancelled before
+    process_job got to start.
+    """
+    workspace.cleanup()
+    job_tasks.pop(job_id, None)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    image: UploadFile = File(...),
+    audio: UploadFile = File(...),
+    priority: str = Form(BATCH),
+    deadline_seconds: Optional[float] = Form(None),
+):
+    """Submit an image and audio file as raw multipart uploads.
+
+    Jobs default to the batch priority class; `deadline_seconds` is counted
+    from submission. Fair share between clients is keyed on the remote
+    address.
+    """
+    try:
+        validate_request(priority, deadline_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    client_id = request.client.host
+
+    try:
+        workspace = workspace_manager.create(prefix="job")
+    except WorkspaceQuotaError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+    try:
+        # Decoding, resizing and file copies run in threads so they don't
+        # stall other WebSocket and polling requests
+        image_bytes = await image.read()
+        try:
+            processed_image_bytes = await asyncio.to_thread(preprocess_image, image_bytes)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Could not decode image")
+
+        image_path = workspace.file("image.jpg")
+        await asyncio.to_thread(image_path.write_bytes, processed_image_bytes)
+
+        # Stream the audio to disk in chunks, stopping as soon as it would
+        # exceed the job or global quota
+        try:
+            audio_path = await asyncio.to_thread(workspace.write_stream, "audio.upload", audio.file)
+        except WorkspaceQuotaError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+        # Fully decode the upload (WAV, Opus, MP3, AAC) in-process so corrupt
+        # streams are rejected now; MuseTalk reads the samples, the upload
+        # itself is only muxed
+        try:
+            await asyncio.to_thread(save_decoded_audio, workspace, audio_path)
+        except WorkspaceQuotaError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        workspace.cleanup()
+        raise
+
+    job = job_store.create(priority=priority, client_id=client_id, deadline_seconds=deadline_seconds)
+    job_id = job["job_id"]
+    task = asyncio.create_task(
+        process_job(job_id, workspace, image_path, audio_path, priority, client_id, deadline_seconds)
+    )
+    task.add_done_callback(lambda _: finish_job(job_id, workspace))
+    job_tasks[job_id] = task
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """Cancel a job if it is still running and remove it with its result."""
+    if job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    task = job_tasks.get(job_id)
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    job_store.delete(job_id)
+    return {"job_id": job_id, "status": "deleted"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Poll the status and progress of a job."""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, request: Request):
+    """Download the result video, honouring HTTP Range requests."""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    result_path = job_store.result_path(job_id)
+    try:
+        file_size = result_path.stat().st_size
+    except FileNotFoundError:
+        # Removed by a concurrent DELETE or the retention sweep
+        raise HTTPException(status_code=404, detail="Job result not found")
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{job_id}.mp4"',
+    }
+
+    try:
+        byte_range = parse_range_header(request.headers.get("range"), file_size)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{file_size}"}
+        )
+
+    if byte_range is None:
+        start, end, status_code = 0, file_size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        iter_file_range(result_path, start, end),
+        status_code=status_code,
+        media_type="video/mp4",
+        headers=headers,
+    )
+
+@app.get("/metrics")
+async def get_metrics():
+    """Scheduler counters per priority class, including deadline misses."""
+    return scheduler.metrics()
+
+async def sweep_jobs():
+    """Periodically drop finished jobs older than the retention period."""
+    while True:
+        removed = job_store.sweep(JOB_RETENTION_SECONDS, active=set(job_tasks))
+        if removed:
+            print(f"Removed {removed} expired jobs")
+        await asyncio.sleep(600)
+
+@app.on_event("startup")
+async def start_sweepers():
+    workspace_manager.start_sweeper()
+    background_tasks.add(asyncio.create_task(sweep_jobs()))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
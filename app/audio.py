@@ -0,0 +1,67 @@
+import io
+from pathlib import Path
+
+import av
+import numpy as np
+
+# Whisper feature extraction expects 16 kHz mono
+WHISPER_SAMPLE_RATE = 16000
+
+
+def _open(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif isinstance(source, Path):
+        source = str(source)
+    return av.open(source, mode="r")
+
+
+def _as_list(frames):
+    # AudioResampler.resample returns a list on PyAV >= 9 and a frame or None before
+    if frames is None:
+        return []
+    if isinstance(frames, list):
+        return frames
+    return [frames]
+
+
+def decode_audio(source, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """Decode compressed or PCM audio in-process to a mono float32 array.
+
+    `source` may be raw bytes, a path or a file-like object in any format
+    FFmpeg can read (WAV, Opus, MP3, AAC, ...). The result is resampled to
+    `sample_rate` with samples in [-1, 1].
+    """
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=sample_rate)
+    chunks = []
+    try:
+        with _open(source) as container:
+            if not container.streams.audio:
+                raise ValueError("No audio stream found")
+            stream = container.streams.audio[0]
+            for frame in container.decode(stream):
+                # Let the resampler derive timestamps itself
+                frame.pts = None
+                for resampled in _as_list(resampler.resample(frame)):
+                    chunks.append(resampled.to_ndarray().reshape(-1))
+            # Flush samples buffered inside the resampler
+            for resampled in _as_list(resampler.resample(None)):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+    except av.error.FFmpegError as e:
+        raise ValueError(f"Could not decode audio: {e}")
+
+    if not chunks:
+        raise ValueError("Audio stream contains no samples")
+    return np.concatenate(chunks).astype(np.float32, copy=False)
+
+
+def decoded_path(audio_path) -> Path:
+    """Sidecar file holding the decoded samples of audio_path."""
+    return Path(f"{audio_path}.npy")
+
+
+def encode_samples(samples: np.ndarray) -> bytes:
+    """Serialize decoded samples as .npy bytes, keeping float32 precision."""
+    buffer = io.BytesIO()
+    np.save(buffer, samples.astype(np.float32, copy=False))
+    return buffer.getvalue()
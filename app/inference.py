@@ -7,18 +7,24 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "musetal
 # Add "app/musetalk/musetalk" to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "musetalk", "musetalk")))
 
-import uuid
+import queue
+import numpy as np
 import torch
 import shutil
 import cv2
+from concurrent.futures import ThreadPoolExecutor
 from omegaconf import OmegaConf
 from transformers import WhisperModel
 
 # Local imports (update based on corrected structure)
+import scripts.realtime_inference as realtime_inference
 from scripts.realtime_inference import Avatar, fast_check_ffmpeg
 from utils.face_parsing import FaceParsing
 from utils.utils import load_all_model
-from utils.audio_processor import AudioProcessor
+
+from blending import BlendPlan, blend_batch
+from whisper_features import ArrayAudioProcessor
+from workspace import WorkspaceManager, WorkspaceQuotaError
 
 
 # ---------- Config ----------
@@ -32,6 +38,10 @@ FFMPEG_PATH = "./ffmpeg-master-latest-win64-gpl-shared/bin"
 FPS = 25
 BATCH_SIZE = 2
 VERSION = "v15"
+BLEND_BATCH_SIZE = 8
+BLEND_WORKERS = 4
+
+
 
 # ---------- Load Models Once ----------
 vae, unet, pe = load_all_model(
@@ -44,7 +54,9 @@ timesteps = torch.tensor([0], device=DEVICE)
 pe = pe.half().to(DEVICE)
 vae.vae = vae.vae.half().to(DEVICE)
 unet.model = unet.model.half().to(DEVICE)
-audio_processor = AudioProcessor(feature_extractor_path=WHISPER_DIR)
+audio_processor = ArrayAudioProcessor(feature_extractor_path=WHISPER_DIR)
+# Avatar.inference reads the module-level audio_processor of the script
+realtime_inference.audio_processor = audio_processor
 weight_dtype = unet.model.dtype
 whisper = WhisperModel.from_pretrained(WHISPER_DIR).to(device=DEVICE, dtype=weight_dtype).eval()
 whisper.requires_grad_(False)
@@ -52,54 +64,141 @@ whisper.requires_grad_(False)
 # ---------- Face Parsing ----------
 fp = FaceParsing(left_cheek_width=90, right_cheek_width=90)
 
-
-def infer_talking_face(image_path: str, audio_path: str, output_path: str) -> str:
-    session_id = str(uuid.uuid4())[:8]
-    avatar_id = f"session_{session_id}"
-    avatar_path = f"./temp/{avatar_id}"
-
-    # Save single frame from input image
-    os.makedirs(avatar_path, exist_ok=True)
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Failed to read image from {image_path}")
-    cv2.imwrite(os.path.join(avatar_path, "00000000.png"), img)
-
-    # Prepare config for the Avatar object
-    mock_config = {
-        avatar_id: {
-            "preparation": True,
-            "video_path": avatar_path,
-            "audio_clips": {
-                "output": audio_path
+# ---------- Workspaces ----------
+workspace_manager = WorkspaceManager("./temp")
+workspace_manager.start_sweeper()
+
+# ---------- Paste-back ----------
+blend_pool = ThreadPoolExecutor(max_workers=BLEND_WORKERS)
+
+
+class BatchBlendAvatar(Avatar):
+    """Avatar whose paste-back blends decoded faces in batches with NumPy.
+
+    All avatar material, frames and the output video live in the given
+    workspace, and writing frames stops once the workspace quota is hit.
+    """
+
+    def __init__(self, *args, workspace, **kwargs):
+        # Set before Avatar.__init__, which calls init()
+        self.workspace = workspace
+        self.quota_error = None
+        super().__init__(*args, **kwargs)
+        self.blend_plan = BlendPlan.from_avatar(self)
+
+    def init(self):
+        # Replace the ./results/<version>/avatars/<id> base path with the workspace
+        self.base_path = str(self.workspace.file("avatar"))
+        self.avatar_path = self.base_path
+        self.full_imgs_path = f"{self.avatar_path}/full_imgs"
+        self.coords_path = f"{self.avatar_path}/coords.pkl"
+        self.latents_out_path = f"{self.avatar_path}/latents.pt"
+        self.video_out_path = f"{self.avatar_path}/vid_output/"
+        self.mask_out_path = f"{self.avatar_path}/mask"
+        self.mask_coords_path = f"{self.avatar_path}/mask_coords.pkl"
+        self.avatar_info_path = f"{self.avatar_path}/avator_info.json"
+        super().init()
+
+    def process_frames(self, res_frame_queue, video_len, skip_save_images):
+        # Track usage incrementally rather than walking the frame dir per batch
+        usage = self.workspace.usage()
+
+        # Same termination rule as the upstream per-frame loop
+        while self.idx < video_len - 1:
+            try:
+                batch = [res_frame_queue.get(block=True, timeout=1)]
+            except queue.Empty:
+                continue
+
+            # Drain whatever else the UNet/VAE loop has already produced
+            limit = min(BLEND_BATCH_SIZE, video_len - 1 - self.idx)
+            while len(batch) < limit:
+                try:
+                    batch.append(res_frame_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Over quota: keep draining so generation can finish, but write nothing
+            if self.quota_error is not None:
+                self.idx += len(batch)
+                continue
+
+            combined = blend_batch(self.blend_plan, batch, self.idx, executor=blend_pool)
+            for combine_frame in combined:
+                if skip_save_images is False:
+                    frame_path = f"{self.avatar_path}/tmp/{str(self.idx).zfill(8)}.png"
+                    cv2.imwrite(frame_path, combine_frame)
+                    usage += os.path.getsize(frame_path)
+                self.idx = self.idx + 1
+
+            if usage > self.workspace.quota_bytes:
+                self.quota_error = WorkspaceQuotaError(
+                    f"Workspace {self.workspace.name} exceeded its {self.workspace.quota_bytes} byte quota "
+                    f"after {self.idx} frames"
+                )
+
+
+def infer_talking_face(image_path: str, audio_path: str, output_path: str, samples: np.ndarray = None) -> str:
+    # Samples already decoded by the caller (audio.decode_audio) feed Whisper
+    # directly; audio_path is then only read by the ffmpeg mux
+    decoded_key = str(audio_path)
+    if samples is not None:
+        audio_processor.decoded[decoded_key] = samples
+
+    try:
+        # Intermediates are staged in a workspace removed on success, error or cancel
+        with workspace_manager.workspace(prefix="session") as workspace:
+            avatar_id = workspace.name
+            avatar_path = str(workspace.file("frames"))
+
+            # Save single frame from input image
+            os.makedirs(avatar_path, exist_ok=True)
+            img = cv2.imread(image_path)
+            if img is None:
+                raise ValueError(f"Failed to read image from {image_path}")
+            cv2.imwrite(os.path.join(avatar_path, "00000000.png"), img)
+
+            # Prepare config for the Avatar object
+            mock_config = {
+                avatar_id: {
+                    "preparation": True,
+                    "video_path": avatar_path,
+                    "audio_clips": {
+                        "output": audio_path
+                    }
+                }
             }
-        }
-    }
-
-    temp_yaml_path = f"./temp/{avatar_id}.yaml"
-    OmegaConf.save(config=OmegaConf.create(mock_config), f=temp_yaml_path)
-
-    # Ensure ffmpeg is found
-    if not fast_check_ffmpeg():
-        os.environ["PATH"] = f"{FFMPEG_PATH};{os.environ['PATH']}"
-        if not fast_check_ffmpeg():
-            raise RuntimeError("ffmpeg not found in system path")
-
-    # Run inference
-    inference_cfg = OmegaConf.load(temp_yaml_path)
-    for avatar_id in inference_cfg:
-        info = inference_cfg[avatar_id]
-        avatar = Avatar(
-            avatar_id=avatar_id,
-            video_path=info["video_path"],
-            bbox_shift=0,
-            batch_size=BATCH_SIZE,
-            preparation=info["preparation"]
-        )
-        for audio_num, audio_path in info["audio_clips"].items():
-            avatar.inference(audio_path, audio_num, FPS, skip_save_images=False)
-
-    # Move the result video to desired location
-    output_video_path = os.path.join(avatar.video_out_path, "output.mp4")
-    shutil.move(output_video_path, output_path)
-    return output_path
+
+            temp_yaml_path = str(workspace.file(f"{avatar_id}.yaml"))
+            OmegaConf.save(config=OmegaConf.create(mock_config), f=temp_yaml_path)
+
+            # Ensure ffmpeg is found
+            if not fast_check_ffmpeg():
+                os.environ["PATH"] = f"{FFMPEG_PATH};{os.environ['PATH']}"
+                if not fast_check_ffmpeg():
+                    raise RuntimeError("ffmpeg not found in system path")
+
+            # Run inference
+            inference_cfg = OmegaConf.load(temp_yaml_path)
+            for avatar_id in inference_cfg:
+                info = inference_cfg[avatar_id]
+                avatar = BatchBlendAvatar(
+                    avatar_id=avatar_id,
+                    video_path=info["video_path"],
+                    bbox_shift=0,
+                    batch_size=BATCH_SIZE,
+                    preparation=info["preparation"],
+                    workspace=workspace
+                )
+                workspace.check_quota()
+                for audio_num, audio_path in info["audio_clips"].items():
+                    avatar.inference(audio_path, audio_num, FPS, skip_save_images=False)
+                    if avatar.quota_error is not None:
+                        raise avatar.quota_error
+
+            # Move the result video to desired location
+            output_video_path = os.path.join(avatar.video_out_path, "output.mp4")
+            shutil.move(output_video_path, output_path)
+            return output_path
+    finally:
+        audio_processor.decoded.pop(decoded_key, None)
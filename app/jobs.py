@@ -0,0 +1,162 @@
+import json
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+# Job lifecycle states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+RESULT_NAME = "result.mp4"
+CHUNK_SIZE = 1024 * 1024
+
+
+class JobStore:
+    """File-backed store for HTTP lipsync jobs.
+
+    Each job lives in `<root>/<job_id>/` with a `job.json` status record
+    and, once finished, the result video.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def result_path(self, job_id: str) -> Path:
+        return self.job_dir(job_id) / RESULT_NAME
+
+    def create(self, **fields) -> dict:
+        """Create a new queued job and its directory.
+
+        Extra fields (e.g. scheduling parameters) are stored on the record.
+        """
+        job_id = uuid.uuid4().hex
+        self.job_dir(job_id).mkdir(parents=True)
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "progress": 0.0,
+            "message": "Queued",
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        job.update(fields)
+        self._write(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Return the job record, or None if the job does not exist."""
+        # Job IDs are hex UUIDs; reject anything that could escape the root
+        if not job_id.isalnum():
+            return None
+        path = self.job_dir(job_id) / "job.json"
+        with self._lock:
+            if not path.exists():
+                return None
+            with open(path, "r") as f:
+                return json.load(f)
+
+    def update(self, job_id: str, **fields) -> dict:
+        """Merge fields into the job record and persist it."""
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        job.update(fields)
+        job["updated_at"] = time.time()
+        self._write(job)
+        return job
+
+    def delete(self, job_id: str) -> None:
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def sweep(self, max_age: float, active=()) -> int:
+        """Remove finished jobs not updated within max_age seconds.
+
+        Unfinished jobs without a live task (e.g. left over from a restart)
+        are marked failed so they expire like any other finished job.
+        """
+        now = time.time()
+        removed = 0
+        for job_dir in self.root.iterdir():
+            job = self.get(job_dir.name)
+            if job is None:
+                # No status record, so the job never finished being created
+                if now - job_dir.stat().st_mtime > max_age:
+                    self.delete(job_dir.name)
+                    removed += 1
+                continue
+            if job["status"] in (QUEUED, RUNNING):
+                if job["job_id"] not in active:
+                    self.update(job["job_id"], status=FAILED, message="Failed", error="Job was interrupted")
+                continue
+            if now - job["updated_at"] > max_age:
+                self.delete(job["job_id"])
+                removed += 1
+        return removed
+
+    def _write(self, job: dict) -> None:
+        # Write to a temp file and rename so pollers never see a partial record
+        path = self.job_dir(job["job_id"]) / "job.json"
+        tmp_path = path.with_suffix(".tmp")
+        with self._lock:
+            with open(tmp_path, "w") as f:
+                json.dump(job, f)
+            tmp_path.replace(path)
+
+
+def parse_range_header(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` Range header into an inclusive (start, end).
+
+    Returns None when there is no usable range (serve the whole file) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    # Multipart ranges are not supported; fall back to the full body
+    if "," in spec or "-" not in spec:
+        return None
+
+    start_str, end_str = spec.split("-", 1)
+    try:
+        if start_str == "":
+            # Suffix range: the last N bytes
+            length = int(end_str)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            start = max(file_size - length, 0)
+            end = file_size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range: {range_header}")
+
+    end = min(end, file_size - 1)
+    if start >= file_size or start > end:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+    return start, end
+
+
+def iter_file_range(path: Path, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield bytes [start, end] of a file in chunks."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,26 @@
+"""Run MuseTalk's realtime_inference script with in-process audio decoding.
+
+Takes the same arguments as scripts/realtime_inference.py. The script's
+AudioProcessor is swapped for ArrayAudioProcessor, so audio features come
+from the samples the API already decoded instead of librosa.
+"""
+import runpy
+import sys
+from pathlib import Path
+
+# Get the absolute path to the app directory
+APP_DIR = Path(__file__).parent.absolute()
+MUSETALK_DIR = APP_DIR / "musetalk"
+
+# Add both app and musetalk directories to Python path
+sys.path.extend([str(APP_DIR), str(MUSETALK_DIR)])
+
+from musetalk.utils import audio_processor
+from whisper_features import ArrayAudioProcessor
+
+if __name__ == "__main__":
+    # The script imports AudioProcessor by name, so patch it before running it
+    audio_processor.AudioProcessor = ArrayAudioProcessor
+    script = MUSETALK_DIR / "scripts/realtime_inference.py"
+    sys.argv = [str(script)] + sys.argv[1:]
+    runpy.run_path(str(script), run_name="__main__")
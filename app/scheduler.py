@@ -0,0 +1,277 @@
+import asyncio
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, BATCH)
+
+# Fair-share usage halves every USAGE_HALF_LIFE_SECONDS; clients with nothing
+# queued or running are forgotten once it decays below USAGE_EVICT_SECONDS
+USAGE_HALF_LIFE_SECONDS = 300
+USAGE_EVICT_SECONDS = 1.0
+
+# A request with a deadline is ordered as if its client had used this many
+# fewer slot seconds, so a deadline cannot outweigh fair share by more
+DEADLINE_CREDIT_SECONDS = 60
+
+# A preemptible request gives way to interactive work at most this often,
+# so a steady interactive stream cannot starve it
+MAX_PREEMPTIONS = 3
+
+
+def validate_request(priority: str, deadline_seconds: Optional[float]) -> None:
+    """Raise ValueError for an unknown priority class or a non-positive deadline."""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {priority}")
+    if deadline_seconds is not None and deadline_seconds <= 0:
+        raise ValueError("deadline_seconds must be positive")
+
+
+class Preempted(Exception):
+    """Raised by preemptible work that stopped because its ticket was preempted."""
+
+
+class Ticket:
+    """A request waiting for, or holding, an inference slot."""
+
+    def __init__(self, seq: int, priority: str, client_id: str, deadline: Optional[float], preemptible: bool):
+        self.seq = seq
+        self.priority = priority
+        self.client_id = client_id
+        self.submitted_at = time.time()
+        self.queued_at = self.submitted_at
+        self.deadline = deadline
+        self.preemptible = preemptible
+        self.preemptions = 0
+        self.started_at = None
+        self.granted = asyncio.get_running_loop().create_future()
+        # Set while running when the holder should stop and raise Preempted
+        self.preempt = asyncio.Event()
+
+    def overdue(self, now: float) -> bool:
+        return self.deadline is not None and now > self.deadline
+
+    def requeue(self) -> None:
+        self.preemptions += 1
+        self.queued_at = time.time()
+        self.started_at = None
+        self.granted = asyncio.get_running_loop().create_future()
+        self.preempt = asyncio.Event()
+
+
+class InferenceScheduler:
+    """Hands out a fixed number of inference slots by priority.
+
+    Waiting requests are ordered by priority class, then by how much slot
+    time their client has used recently (fair share), then by earliest
+    deadline, and finally by arrival. A deadline counts as
+    DEADLINE_CREDIT_SECONDS less usage, so urgent requests from a light
+    client go first but tiny deadlines cannot bypass fair share. Clients
+    should be identified by something they cannot choose freely, such as
+    their remote address.
+
+    Work run through run() with `preemptible=True` is asked to stop when
+    interactive work is waiting and no slot is free; it is then requeued
+    with its original arrival and deadline. Work holding a slot() block is
+    never interrupted.
+    """
+
+    def __init__(self, slots: int = 1):
+        self.slots = slots
+        self._running = set()
+        self._waiting = []
+        self._seq = itertools.count()
+        # client_id -> (decaying slot seconds, time of last update)
+        self._usage = {}
+        self._metrics = {
+            priority: {
+                "submitted": 0,
+                "completed": 0,
+                "failed": 0,
+                "cancelled": 0,
+                "preempted": 0,
+                "deadline_misses": 0,
+                "total_wait_seconds": 0.0,
+                "total_run_seconds": 0.0,
+            }
+            for priority in PRIORITY_CLASSES
+        }
+
+    def _client_usage(self, client_id: str, now: float) -> float:
+        usage, updated_at = self._usage.get(client_id, (0.0, now))
+        return usage * 0.5 ** ((now - updated_at) / USAGE_HALF_LIFE_SECONDS)
+
+    def _prune_usage(self, now: float) -> None:
+        busy = {t.client_id for t in self._waiting} | {t.client_id for t in self._running}
+        for client_id in list(self._usage):
+            if client_id not in busy and self._client_usage(client_id, now) < USAGE_EVICT_SECONDS:
+                del self._usage[client_id]
+
+    def _key(self, ticket: Ticket, now: float):
+        usage = self._client_usage(ticket.client_id, now)
+        if ticket.deadline is not None:
+            usage -= DEADLINE_CREDIT_SECONDS
+        return (
+            PRIORITY_CLASSES.index(ticket.priority),
+            usage,
+            ticket.deadline if ticket.deadline is not None else math.inf,
+            ticket.seq,
+        )
+
+    def _enqueue(
+        self, priority: str, client_id: str, deadline_seconds: Optional[float], preemptible: bool = False
+    ) -> Ticket:
+        validate_request(priority, deadline_seconds)
+
+        deadline = time.time() + deadline_seconds if deadline_seconds is not None else None
+        ticket = Ticket(next(self._seq), priority, client_id, deadline, preemptible)
+        self._waiting.append(ticket)
+        self._metrics[priority]["submitted"] += 1
+        self._dispatch()
+        return ticket
+
+    def _dispatch(self) -> None:
+        now = time.time()
+        while len(self._running) < self.slots and self._waiting:
+            ticket = min(self._waiting, key=lambda t: self._key(t, now))
+            self._waiting.remove(ticket)
+            self._running.add(ticket)
+            ticket.started_at = now
+            self._metrics[ticket.priority]["total_wait_seconds"] += now - ticket.queued_at
+            ticket.granted.set_result(None)
+        self._preempt_for_interactive()
+
+    def _preempt_for_interactive(self) -> None:
+        # Ask one running batch request per waiting interactive one to stop,
+        # most recently started first since it has done the least work
+        waiting = sum(1 for t in self._waiting if t.priority == INTERACTIVE)
+        waiting -= sum(1 for t in self._running if t.preempt.is_set())
+        candidates = [
+            t for t in self._running
+            if t.priority == BATCH and t.preemptible and t.preemptions < MAX_PREEMPTIONS
+            and not t.preempt.is_set()
+        ]
+        candidates.sort(key=lambda t: t.started_at, reverse=True)
+        for ticket in candidates[:max(waiting, 0)]:
+            ticket.preempt.set()
+
+    def _finish(self, ticket: Ticket, outcome: str, now: float) -> None:
+        metrics = self._metrics[ticket.priority]
+        metrics[outcome] += 1
+        # Any way a request ends past its deadline is a miss
+        if ticket.overdue(now):
+            metrics["deadline_misses"] += 1
+
+    def _release(self, ticket: Ticket, outcome: str) -> None:
+        finished_at = time.time()
+        run_seconds = finished_at - ticket.started_at
+        self._usage[ticket.client_id] = (
+            self._client_usage(ticket.client_id, finished_at) + run_seconds,
+            finished_at,
+        )
+        self._metrics[ticket.priority]["total_run_seconds"] += run_seconds
+        self._running.discard(ticket)
+
+        if outcome == "preempted":
+            self._metrics[ticket.priority]["preempted"] += 1
+            ticket.requeue()
+            self._waiting.append(ticket)
+        else:
+            self._finish(ticket, outcome, finished_at)
+
+        self._prune_usage(finished_at)
+        self._dispatch()
+
+    async def _acquire(self, ticket: Ticket) -> None:
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket in self._waiting:
+                now = time.time()
+                self._waiting.remove(ticket)
+                self._metrics[ticket.priority]["total_wait_seconds"] += now - ticket.queued_at
+                self._finish(ticket, "cancelled", now)
+                self._prune_usage(now)
+                self._dispatch()
+            else:
+                # Granted just as we were cancelled; hand the slot on
+                self._release(ticket, "cancelled")
+            raise
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: str = INTERACTIVE,
+        client_id: str = "anonymous",
+        deadline_seconds: Optional[float] = None,
+    ):
+        """Wait for an inference slot and hold it for the body of the block.
+
+        Raises ValueError for an unknown priority class or a non-positive
+        deadline. A deadline miss is recorded when the request ends, however
+        it ends, after `deadline_seconds` from submission.
+        """
+        ticket = self._enqueue(priority, client_id, deadline_seconds)
+        await self._acquire(ticket)
+
+        outcome = "failed"
+        try:
+            yield ticket
+            outcome = "completed"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            self._release(ticket, outcome)
+
+    async def run(
+        self,
+        work: Callable[[Ticket], Awaitable],
+        priority: str = INTERACTIVE,
+        client_id: str = "anonymous",
+        deadline_seconds: Optional[float] = None,
+        preemptible: bool = False,
+    ):
+        """Await `work(ticket)` while holding a slot and return its result.
+
+        With `preemptible`, a batch request has `ticket.preempt` set when
+        interactive work is waiting for its slot. `work` should then stop,
+        clean up and raise Preempted; it is called again once it wins a slot
+        back, with the same arrival order and deadline. Otherwise behaves
+        like slot().
+        """
+        ticket = self._enqueue(priority, client_id, deadline_seconds, preemptible)
+        while True:
+            await self._acquire(ticket)
+            outcome = "failed"
+            try:
+                result = await work(ticket)
+                outcome = "completed"
+                return result
+            except Preempted:
+                outcome = "preempted"
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                self._release(ticket, outcome)
+
+    def metrics(self) -> dict:
+        """Per-class counters plus current queue depth and overdue waiting requests."""
+        now = time.time()
+        result = {}
+        for priority, metrics in self._metrics.items():
+            finished = metrics["completed"] + metrics["failed"] + metrics["cancelled"]
+            waiting = [t for t in self._waiting if t.priority == priority]
+            result[priority] = dict(
+                metrics,
+                waiting=len(waiting),
+                overdue_waiting=sum(1 for t in waiting if t.overdue(now)),
+                avg_wait_seconds=metrics["total_wait_seconds"] / finished if finished else 0.0,
+            )
+        return {"running": len(self._running), "slots": self.slots, "classes": result}
@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+import numpy as np
+import cv2
+
+# Get the absolute path to the app directory
+APP_DIR = Path(__file__).parent.absolute()
+MUSETALK_DIR = APP_DIR / "musetalk"
+
+# Add both app and musetalk directories to Python path
+sys.path.extend([str(APP_DIR), str(MUSETALK_DIR)])
+
+from blending import BlendPlan, blend_batch
+from musetalk.utils.blending import get_image_blending
+
+def make_avatar(seed=0):
+    """Synthetic frame, face box, crop box and blurred mouth mask."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8)
+    face_box = (200, 120, 400, 330)
+    crop_box = (150, 60, 450, 390)
+
+    # Soft-edged mask the size of the crop box, 3-channel like MuseTalk's
+    x_s, y_s, x_e, y_e = crop_box
+    mask = np.zeros((y_e - y_s, x_e - x_s), dtype=np.uint8)
+    mask[150:280, 60:240] = 255
+    mask = cv2.GaussianBlur(mask, (51, 51), 0)
+    mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
+    return frame, face_box, crop_box, mask
+
+def test_blend_batch_matches_get_image_blending():
+    frame, face_box, crop_box, mask = make_avatar()
+    plan = BlendPlan([frame], [face_box], [mask], [crop_box])
+
+    rng = np.random.default_rng(1)
+    res_frames = [rng.integers(0, 256, size=(256, 256, 3), dtype=np.uint8) for _ in range(3)]
+    combined = blend_batch(plan, res_frames, start_idx=0)
+
+    x1, y1, x2, y2 = face_box
+    for res_frame, ours in zip(res_frames, combined):
+        face = cv2.resize(res_frame, (x2 - x1, y2 - y1))
+        expected = get_image_blending(frame.copy(), face, face_box, mask, crop_box)
+        diff = np.abs(ours.astype(np.int16) - expected.astype(np.int16)).max()
+        assert diff <= 1, f"blend_batch differs from get_image_blending by {diff}"
+
+    # The source frame in the plan must not be modified
+    assert np.array_equal(plan.frames[0], frame)
+
+if __name__ == "__main__":
+    test_blend_batch_matches_get_image_blending()
+    print("✅ blend_batch matches get_image_blending")
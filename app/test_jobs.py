@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Get the absolute path to the app directory
+APP_DIR = Path(__file__).parent.absolute()
+
+# Add the app directory to Python path
+sys.path.append(str(APP_DIR))
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobStore, parse_range_header
+
+def test_parse_range_header():
+    # No usable range: serve the whole file
+    assert parse_range_header(None, 100) is None
+    assert parse_range_header("items=0-10", 100) is None
+    assert parse_range_header("bytes=0-10,20-30", 100) is None
+
+    assert parse_range_header("bytes=0-9", 100) == (0, 9)
+    assert parse_range_header("bytes=90-", 100) == (90, 99)
+    # Ends past the file are clamped, suffix ranges count from the end
+    assert parse_range_header("bytes=50-500", 100) == (50, 99)
+    assert parse_range_header("bytes=-10", 100) == (90, 99)
+    assert parse_range_header("bytes=-500", 100) == (0, 99)
+
+    for header in ("bytes=100-", "bytes=20-10", "bytes=-0", "bytes=a-b"):
+        try:
+            parse_range_header(header, 100)
+        except ValueError:
+            continue
+        raise AssertionError(f"{header} should not be satisfiable")
+
+def test_job_store_sweep():
+    with tempfile.TemporaryDirectory() as root:
+        store = JobStore(Path(root))
+        old = time.time() - 3600
+
+        fresh = store.create()
+        store.update(fresh["job_id"], status=SUCCEEDED)
+        expired = store.create()
+        store.update(expired["job_id"], status=FAILED)
+        # update() stamps updated_at, so backdate the record directly
+        record = store.get(expired["job_id"])
+        record["updated_at"] = old
+        store._write(record)
+
+        running = store.create()
+        store.update(running["job_id"], status=RUNNING)
+        interrupted = store.create()
+        assert interrupted["status"] == QUEUED
+
+        # A directory without a status record expires by its mtime
+        stray = Path(root) / "stray"
+        stray.mkdir()
+        os.utime(stray, (old, old))
+
+        removed = store.sweep(max_age=60, active={running["job_id"]})
+        assert removed == 2
+        assert store.get(expired["job_id"]) is None
+        assert not stray.exists()
+        assert store.get(fresh["job_id"])["status"] == SUCCEEDED
+        assert store.get(running["job_id"])["status"] == RUNNING
+
+        # Unfinished jobs without a live task are failed, not removed
+        job = store.get(interrupted["job_id"])
+        assert job["status"] == FAILED
+        assert job["error"] == "Job was interrupted"
+
+if __name__ == "__main__":
+    test_parse_range_header()
+    print("✅ parse_range_header handles single, suffix and unsatisfiable ranges")
+    test_job_store_sweep()
+    print("✅ JobStore.sweep expires finished jobs and fails interrupted ones")
@@ -0,0 +1,199 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Get the absolute path to the app directory
+APP_DIR = Path(__file__).parent.absolute()
+
+# Add the app directory to Python path
+sys.path.append(str(APP_DIR))
+
+from scheduler import BATCH, INTERACTIVE, USAGE_HALF_LIFE_SECONDS, InferenceScheduler, Preempted
+
+async def settle():
+    """Let every runnable task take its next step."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+async def run_in_order(scheduler, requests):
+    """Queue requests behind a held slot, free it and return the run order."""
+    order = []
+    release = asyncio.Event()
+
+    async def request(name, **kwargs):
+        async with scheduler.slot(**kwargs):
+            order.append(name)
+
+    async def holder():
+        async with scheduler.slot(client_id="holder"):
+            await release.wait()
+
+    tasks = [asyncio.create_task(holder())]
+    await settle()
+    for name, kwargs in requests:
+        tasks.append(asyncio.create_task(request(name, **kwargs)))
+        await settle()
+    release.set()
+    await asyncio.gather(*tasks)
+    return order
+
+def test_priority_then_arrival_order():
+    async def main():
+        scheduler = InferenceScheduler(slots=1)
+        return await run_in_order(scheduler, [
+            ("batch", dict(priority=BATCH, client_id="a")),
+            ("first", dict(priority=INTERACTIVE, client_id="a")),
+            ("second", dict(priority=INTERACTIVE, client_id="a")),
+        ])
+
+    assert asyncio.run(main()) == ["first", "second", "batch"]
+
+def test_fair_share_holds_against_tiny_deadlines():
+    async def main():
+        scheduler = InferenceScheduler(slots=1)
+        # "heavy" has used far more slot time than a deadline is worth
+        scheduler._usage["heavy"] = (1000.0, time.time())
+        return await run_in_order(scheduler, [
+            ("heavy-1", dict(client_id="heavy", deadline_seconds=0.001)),
+            ("heavy-2", dict(client_id="heavy", deadline_seconds=0.001)),
+            ("light", dict(client_id="light")),
+        ])
+
+    assert asyncio.run(main()) == ["light", "heavy-1", "heavy-2"]
+
+def test_deadline_orders_similar_clients():
+    async def main():
+        scheduler = InferenceScheduler(slots=1)
+        scheduler._usage["a"] = (10.0, time.time())
+        return await run_in_order(scheduler, [
+            ("b-plain", dict(client_id="b")),
+            ("a-late", dict(client_id="a", deadline_seconds=60)),
+            ("a-soon", dict(client_id="a", deadline_seconds=5)),
+        ])
+
+    assert asyncio.run(main()) == ["a-soon", "a-late", "b-plain"]
+
+def test_fair_share_usage_decays():
+    async def main():
+        scheduler = InferenceScheduler(slots=1)
+        now = time.time()
+        scheduler._usage["a"] = (100.0, now - USAGE_HALF_LIFE_SECONDS)
+        assert abs(scheduler._client_usage("a", now) - 50.0) < 1e-6
+
+        # Idle clients are forgotten once their usage has decayed
+        scheduler._usage["idle"] = (100.0, now - 20 * USAGE_HALF_LIFE_SECONDS)
+        scheduler._prune_usage(now)
+        assert "idle" not in scheduler._usage
+        assert "a" in scheduler._usage
+
+    asyncio.run(main())
+
+def test_cancel_while_waiting():
+    async def main():
+        scheduler = InferenceScheduler(slots=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot():
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot(priority=BATCH, deadline_seconds=0.01):
+                raise AssertionError("cancelled request must not run")
+
+        held = asyncio.create_task(holder())
+        await settle()
+        waiting = asyncio.create_task(waiter())
+        await settle()
+        await asyncio.sleep(0.02)
+        assert scheduler.metrics()["classes"][BATCH]["overdue_waiting"] == 1
+
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        release.set()
+        await held
+        return scheduler.metrics()
+
+    metrics = asyncio.run(main())
+    batch = metrics["classes"][BATCH]
+    assert batch["waiting"] == 0
+    assert batch["overdue_waiting"] == 0
+    assert batch["cancelled"] == 1
+    # A request cancelled past its deadline still missed it
+    assert batch["deadline_misses"] == 1
+    assert metrics["classes"][INTERACTIVE]["completed"] == 1
+
+def test_granted_while_cancelled_hands_slot_on():
+    async def main():
+        scheduler = InferenceScheduler(slots=1)
+        order = []
+
+        async def request(name):
+            async with scheduler.slot():
+                order.append(name)
+
+        async with scheduler.slot():
+            first = asyncio.create_task(request("first"))
+            second = asyncio.create_task(request("second"))
+            await settle()
+
+        # The slot went to "first"; cancel it before it wakes up to take it
+        first.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        return scheduler, order
+
+    scheduler, order = asyncio.run(main())
+    assert order == ["second"]
+    assert scheduler.metrics()["running"] == 0
+    assert scheduler.metrics()["classes"][INTERACTIVE]["cancelled"] == 1
+
+def test_batch_is_preempted_and_requeued():
+    async def main():
+        scheduler = InferenceScheduler(slots=1)
+        order = []
+
+        async def batch_work(ticket):
+            order.append("batch-start")
+            try:
+                await asyncio.wait_for(ticket.preempt.wait(), timeout=0.2)
+            except asyncio.TimeoutError:
+                order.append("batch-done")
+                return "done"
+            order.append("batch-preempted")
+            raise Preempted()
+
+        async def interactive():
+            async with scheduler.slot(client_id="b"):
+                order.append("interactive")
+
+        batch = asyncio.create_task(
+            scheduler.run(batch_work, priority=BATCH, client_id="a", preemptible=True)
+        )
+        await settle()
+        await interactive()
+        assert await batch == "done"
+        return scheduler.metrics(), order
+
+    metrics, order = asyncio.run(main())
+    assert order == ["batch-start", "batch-preempted", "interactive", "batch-start", "batch-done"]
+    batch = metrics["classes"][BATCH]
+    assert batch["submitted"] == 1
+    assert batch["preempted"] == 1
+    assert batch["completed"] == 1
+
+if __name__ == "__main__":
+    test_priority_then_arrival_order()
+    print("✅ Interactive requests run before batch ones, in arrival order")
+    test_fair_share_holds_against_tiny_deadlines()
+    print("✅ Tiny deadlines do not bypass fair share")
+    test_deadline_orders_similar_clients()
+    print("✅ Deadlines order requests from clients with similar usage")
+    test_fair_share_usage_decays()
+    print("✅ Fair-share usage decays and idle clients are forgotten")
+    test_cancel_while_waiting()
+    print("✅ Cancelling a waiting request counts its deadline miss")
+    test_granted_while_cancelled_hands_slot_on()
+    print("✅ A slot granted to a cancelled request is handed on")
+    test_batch_is_preempted_and_requeued()
+    print("✅ Batch work is preempted by interactive work and requeued")
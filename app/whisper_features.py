@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+from musetalk.utils.audio_processor import AudioProcessor
+
+from audio import WHISPER_SAMPLE_RATE, decode_audio, decoded_path
+
+
+class ArrayAudioProcessor(AudioProcessor):
+    """AudioProcessor that decodes in-process instead of through librosa.
+
+    For each audio path it uses, in order: samples registered in `decoded`
+    by the caller, a `decoded_path` sidecar written by the API, or the file
+    itself decoded with PyAV. Compressed uploads (Opus, MP3, AAC) thus need
+    neither an intermediate WAV nor an ffmpeg subprocess; the file is only
+    read again by the ffmpeg mux of the final video.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # str(audio path) -> mono float32 samples at WHISPER_SAMPLE_RATE
+        self.decoded = {}
+
+    def load_samples(self, audio_path):
+        samples = self.decoded.get(str(audio_path))
+        if samples is not None:
+            return samples
+        sidecar = decoded_path(audio_path)
+        if sidecar.exists():
+            return np.load(sidecar)
+        if not os.path.exists(audio_path):
+            return None
+        return decode_audio(audio_path, sample_rate=WHISPER_SAMPLE_RATE)
+
+    def get_audio_feature(self, audio_path, start_index=0, weight_dtype=None):
+        samples = self.load_samples(audio_path)
+        if samples is None:
+            return None
+
+        # Split audio into 30s segments, as Whisper expects
+        segment_length = 30 * WHISPER_SAMPLE_RATE
+        features = []
+        for i in range(0, len(samples), segment_length):
+            audio_feature = self.feature_extractor(
+                samples[i:i + segment_length],
+                return_tensors="pt",
+                sampling_rate=WHISPER_SAMPLE_RATE
+            ).input_features
+            if weight_dtype is not None:
+                audio_feature = audio_feature.to(dtype=weight_dtype)
+            features.append(audio_feature)
+
+        return features, len(samples)
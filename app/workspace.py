@@ -0,0 +1,311 @@
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+# RAM-backed staging directory, used when present and writable
+TMPFS_ROOT = Path(os.environ.get("WORKSPACE_TMPFS_ROOT", "/dev/shm/illum"))
+
+# Quotas in bytes
+JOB_QUOTA_BYTES = int(os.environ.get("WORKSPACE_JOB_QUOTA_BYTES", 2 * 1024 ** 3))
+GLOBAL_QUOTA_BYTES = int(os.environ.get("WORKSPACE_GLOBAL_QUOTA_BYTES", 20 * 1024 ** 3))
+
+# Workspaces untouched for this long and not owned by a live job are swept
+ORPHAN_TTL_SECONDS = int(os.environ.get("WORKSPACE_ORPHAN_TTL_SECONDS", 6 * 3600))
+SWEEP_INTERVAL_SECONDS = int(os.environ.get("WORKSPACE_SWEEP_INTERVAL_SECONDS", 600))
+
+CHUNK_SIZE = 1024 * 1024
+
+# Each manager keeps its workspaces under `<root>/owner_<pid>_<id>/` and
+# touches a heartbeat file there whenever it creates a workspace or sweeps
+OWNER_DIR_PATTERN = re.compile(r"^owner_(\d+)_[0-9a-f]+$")
+HEARTBEAT_NAME = ".heartbeat"
+
+
+class WorkspaceQuotaError(RuntimeError):
+    """Raised when a workspace or the whole store exceeds its quota."""
+
+
+def dir_size(path: Path) -> int:
+    """Total size in bytes of all files under path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def last_modified(path: Path) -> float:
+    """Newest mtime of path or anything below it.
+
+    A directory's own mtime does not change when files inside it are
+    rewritten, so the whole tree is checked.
+    """
+    try:
+        newest = os.lstat(path).st_mtime
+    except FileNotFoundError:
+        return 0.0
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                newest = max(newest, os.lstat(os.path.join(root, name)).st_mtime)
+            except FileNotFoundError:
+                pass
+    return newest
+
+
+def remove_path(path) -> None:
+    """Remove a file or directory tree, ignoring paths that are already gone."""
+    path = Path(path)
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+
+def _heartbeat_time(owner_dir: Path) -> float:
+    try:
+        return os.lstat(owner_dir / HEARTBEAT_NAME).st_mtime
+    except FileNotFoundError:
+        # Written before heartbeats existed
+        return last_modified(owner_dir)
+
+
+class Workspace:
+    """A per-job scratch directory owned by a WorkspaceManager."""
+
+    def __init__(self, manager: "WorkspaceManager", path: Path, quota_bytes: int):
+        self.manager = manager
+        self.path = path
+        self.quota_bytes = quota_bytes
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    def file(self, name: str) -> Path:
+        """Path to a file inside the workspace."""
+        return self.path / name
+
+    def usage(self) -> int:
+        return dir_size(self.path)
+
+    def check_quota(self) -> None:
+        usage = self.usage()
+        if usage > self.quota_bytes:
+            raise WorkspaceQuotaError(
+                f"Workspace {self.name} uses {usage} bytes, over its {self.quota_bytes} byte quota"
+            )
+
+    def write_stream(self, name: str, fileobj: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Path:
+        """Copy fileobj into the workspace in chunks.
+
+        Stops with WorkspaceQuotaError as soon as the copy would take the
+        workspace over its quota or all workspaces over the global quota,
+        so an oversized upload never lands in full.
+        """
+        path = self.file(name)
+        limit = min(
+            self.quota_bytes - self.usage(),
+            self.manager.global_quota_bytes - self.manager.usage(),
+        )
+        written = 0
+        with open(path, "wb") as f:
+            while True:
+                chunk = fileobj.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > limit:
+                    raise WorkspaceQuotaError(
+                        f"Upload to workspace {self.name} exceeds the available quota of {max(limit, 0)} bytes"
+                    )
+                f.write(chunk)
+        return path
+
+    def cleanup(self) -> None:
+        remove_path(self.path)
+        self.manager.release(self)
+
+
+class WorkspaceManager:
+    """Creates job workspaces, enforces quotas and sweeps orphaned ones.
+
+    Workspaces are staged under `tmpfs_root` when it is usable and has room
+    for a full job, otherwise under `disk_root`. Several managers (in one
+    process or across workers) may share the roots: each one works in its
+    own `owner_<pid>_<id>` subdirectory, and only removes another owner's
+    directory once that owner's process has exited or its heartbeat is
+    older than the TTL. The heartbeat covers PIDs that are reused, such as
+    PID 1 in a restarted container.
+    """
+
+    def __init__(
+        self,
+        disk_root: Path,
+        tmpfs_root: Optional[Path] = TMPFS_ROOT,
+        job_quota_bytes: int = JOB_QUOTA_BYTES,
+        global_quota_bytes: int = GLOBAL_QUOTA_BYTES,
+        orphan_ttl: float = ORPHAN_TTL_SECONDS,
+    ):
+        self.disk_root = Path(disk_root)
+        self.tmpfs_root = Path(tmpfs_root) if tmpfs_root else None
+        self.job_quota_bytes = job_quota_bytes
+        self.global_quota_bytes = global_quota_bytes
+        self.orphan_ttl = orphan_ttl
+        self.owner = f"owner_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+
+        self.disk_root.mkdir(parents=True, exist_ok=True)
+        if self.tmpfs_root is not None:
+            try:
+                self.tmpfs_root.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                self.tmpfs_root = None
+        self.heartbeat()
+
+    def roots(self):
+        return [root for root in (self.tmpfs_root, self.disk_root) if root is not None]
+
+    def owned_dirs(self):
+        return [root / self.owner for root in self.roots()]
+
+    def heartbeat(self) -> None:
+        """Mark this manager's owner directories as live."""
+        for owned_dir in self.owned_dirs():
+            owned_dir.mkdir(parents=True, exist_ok=True)
+            (owned_dir / HEARTBEAT_NAME).touch()
+
+    def _pick_root(self) -> Path:
+        if self.tmpfs_root is not None and os.access(self.tmpfs_root, os.W_OK):
+            if shutil.disk_usage(self.tmpfs_root).free > self.job_quota_bytes:
+                return self.tmpfs_root
+        return self.disk_root
+
+    def usage(self) -> int:
+        """Bytes used by all workspaces under the roots, whoever owns them."""
+        return sum(dir_size(root) for root in self.roots())
+
+    def create(self, prefix: str = "job") -> Workspace:
+        """Create a new workspace, sweeping orphans first if over the global quota."""
+        if self.usage() > self.global_quota_bytes:
+            self.sweep()
+            usage = self.usage()
+            if usage > self.global_quota_bytes:
+                raise WorkspaceQuotaError(
+                    f"Workspaces use {usage} bytes, over the {self.global_quota_bytes} byte global quota"
+                )
+
+        self.heartbeat()
+        path = self._pick_root() / self.owner / f"{prefix}_{uuid.uuid4().hex[:8]}"
+        path.mkdir(parents=True)
+        workspace = Workspace(self, path, self.job_quota_bytes)
+        with self._lock:
+            self._active[path] = workspace
+        return workspace
+
+    def release(self, workspace: Workspace) -> None:
+        with self._lock:
+            self._active.pop(workspace.path, None)
+
+    @contextmanager
+    def workspace(self, prefix: str = "job"):
+        """Context manager that always removes the workspace on exit.
+
+        Cleanup runs on success, on error and on task cancellation.
+        """
+        workspace = self.create(prefix)
+        try:
+            yield workspace
+        finally:
+            workspace.cleanup()
+
+    def sweep(self) -> int:
+        """Remove orphaned workspaces and return how many were removed.
+
+        Orphans are this manager's workspaces that are not in use and have
+        not been written to within the TTL, directories of owners whose
+        process has exited or whose heartbeat is older than the TTL, and
+        stray entries older than the TTL.
+        """
+        self.heartbeat()
+        now = time.time()
+        removed = 0
+        with self._lock:
+            active = set(self._active)
+
+        def remove(path):
+            nonlocal removed
+            print(f"[Workspace] Removing orphaned workspace: {path}")
+            remove_path(path)
+            removed += 1
+
+        for owned_dir in self.owned_dirs():
+            if not owned_dir.is_dir():
+                continue
+            for path in owned_dir.iterdir():
+                if path.name == HEARTBEAT_NAME:
+                    continue
+                if path not in active and now - last_modified(path) > self.orphan_ttl:
+                    remove(path)
+
+        for root in self.roots():
+            for path in root.iterdir():
+                if path.name == self.owner:
+                    continue
+                match = OWNER_DIR_PATTERN.match(path.name)
+                if match:
+                    # Another manager's directory; it sweeps its own workspaces
+                    # while its process is alive and heartbeating
+                    if not _pid_alive(int(match.group(1))) or now - _heartbeat_time(path) > self.orphan_ttl:
+                        remove(path)
+                elif now - last_modified(path) > self.orphan_ttl:
+                    remove(path)
+        return removed
+
+    def start_sweeper(self, interval: float = SWEEP_INTERVAL_SECONDS) -> None:
+        """Run sweep() periodically on a daemon thread."""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"[Workspace] Sweep failed: {e}")
+
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=run, name="workspace-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        if self._sweeper is not None:
+            self._stop.set()
+            self._sweeper.join()
+            self._sweeper = None
@@ -5,6 +5,7 @@ import base64
 import argparse
 from pathlib import Path
 import time
+import requests
 
 # Get the absolute path to the client directory
 CLIENT_DIR = Path(__file__).parent.absolute()
@@ -21,7 +22,7 @@ async def heartbeat(websocket):
             print(f"Heartbeat error: {e}")
             break
 
-async def test_lipsync(image_path, audio_path):
+async def test_lipsync(image_path, audio_path, priority="interactive", deadline_seconds=None):
     # Read and encode files
     with open(image_path, 'rb') as f:
         image_base64 = base64.b64encode(f.read()).decode('utf-8')
@@ -47,8 +48,11 @@ async def test_lipsync(image_path, audio_path):
             # Send request
             request = {
                 "image_base64": image_base64,
-                "audio_base64": audio_base64
+                "audio_base64": audio_base64,
+                "priority": priority
             }
+            if deadline_seconds is not None:
+                request["deadline_seconds"] = deadline_seconds
             print("Sending request...")
             await websocket.send(json.dumps(request))
             
@@ -100,10 +104,56 @@ async def test_lipsync(image_path, audio_path):
             except asyncio.CancelledError:
                 pass
 
+def test_lipsync_http(image_path, audio_path, priority="batch", deadline_seconds=None,
+                      base_url="http://localhost:8000"):
+    """Submit a job over the HTTP API, poll until done and download the result"""
+    with open(image_path, 'rb') as image_file, open(audio_path, 'rb') as audio_file:
+        files = {
+            "image": (Path(image_path).name, image_file),
+            "audio": (Path(audio_path).name, audio_file)
+        }
+        data = {"priority": priority}
+        if deadline_seconds is not None:
+            data["deadline_seconds"] = deadline_seconds
+        print("Submitting job...")
+        response = requests.post(f"{base_url}/jobs", files=files, data=data)
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    print(f"Job ID: {job_id}")
+
+    start_time = time.time()
+    last_message = None
+    while True:
+        job = requests.get(f"{base_url}/jobs/{job_id}").json()
+        if job["message"] != last_message:
+            print(f"Status: {job['message']} ({job['progress'] * 100:.0f}%)")
+            last_message = job["message"]
+        if job["status"] == "succeeded":
+            break
+        if job["status"] == "failed":
+            print(f"Error: {job.get('error', 'Unknown error')}")
+            print(f"Time elapsed: {time.time() - start_time:.2f} seconds")
+            return
+        time.sleep(2)
+
+    # Stream the result to disk
+    timestamp = int(time.time())
+    output_path = OUTPUT_DIR / "videos" / f"output_{timestamp}.mp4"
+    with requests.get(f"{base_url}/jobs/{job_id}/result", stream=True) as response:
+        response.raise_for_status()
+        with open(output_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+    print(f"Video saved to {output_path}")
+    print(f"Time elapsed: {time.time() - start_time:.2f} seconds")
+
 def main():
     parser = argparse.ArgumentParser(description='Test the lip-sync WebSocket API')
     parser.add_argument('--image', type=str, required=True, help='Path to input image file')
     parser.add_argument('--audio', type=str, required=True, help='Path to input audio file')
+    parser.add_argument('--mode', choices=['ws', 'http'], default='ws', help='Use the WebSocket or HTTP job API')
+    parser.add_argument('--priority', choices=['interactive', 'batch'], help='Priority class (default: interactive for ws, batch for http)')
+    parser.add_argument('--deadline', type=float, help='Deadline in seconds from submission')
     
     args = parser.parse_args()
     
@@ -126,7 +176,10 @@ def main():
     print(f"Using image path: {image_path}")
     print(f"Using audio path: {audio_path}")
     
-    asyncio.run(test_lipsync(image_path, audio_path))
+    if args.mode == 'http':
+        test_lipsync_http(image_path, audio_path, args.priority or 'batch', args.deadline)
+    else:
+        asyncio.run(test_lipsync(image_path, audio_path, args.priority or 'interactive', args.deadline))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file